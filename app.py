@@ -1,9 +1,11 @@
+import io
+
 import streamlit as st
 import pandas as pd
 import numpy as np
 import joblib
-import matplotlib.pyplot as plt
-from sklearn.preprocessing import StandardScaler
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
 # This block configures the Streamlit application layout
 # Sets page title used in browser tab
@@ -99,9 +101,15 @@ def load_models():
     behavior_model = joblib.load("models/behavior_model.pkl")
     value_model = joblib.load("models/value_model.pkl")
     stability_model = joblib.load("models/stability_model.pkl")
-    return behavior_model, value_model, stability_model
+    scaler = joblib.load("models/behavior_scaler.pkl")
+    # KMeans requires X and cluster centers to share a dtype,
+    # so cast the centers once to match the float32 feature matrix
+    behavior_model.cluster_centers_ = behavior_model.cluster_centers_.astype(
+        np.float32
+    )
+    return behavior_model, value_model, stability_model, scaler
 
-behavior_model, value_model, stability_model = load_models()
+behavior_model, value_model, stability_model, scaler = load_models()
 
 # This block defines cluster labels
 # Maps numeric clusters to business meaning
@@ -131,6 +139,52 @@ CLUSTER_ACTIONS = {
     4: "Immediate retention calls and win-back offers"
 }
 
+# This block defines the model feature columns
+# Must match the uploaded CSV schema
+# Shared by preprocessing and predictions
+# Keeps column logic centralized
+# Static configuration only
+# No computation here
+FEATURE_COLS = [
+    "total_orders",
+    "total_quantity",
+    "total_spend",
+    "avg_order_value",
+    "recency_days",
+    "unique_products"
+]
+
+# This block builds the customer feature matrix
+# Cached on the uploaded file bytes
+# Reruns skip the groupby and model work
+# Normalizes column names
+# Applies the training-time scaler
+# Applies clustering model
+@st.cache_data(show_spinner=False)
+def build_features(file_bytes):
+    df = pd.read_csv(io.BytesIO(file_bytes), engine="pyarrow")
+
+    df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
+
+    df = df.rename(columns={"customerid": "customer_id"})
+
+    df = df.astype({
+        "total_orders": "int32",
+        "total_quantity": "int32",
+        "recency_days": "int32",
+        "unique_products": "int32",
+        "total_spend": "float32",
+        "avg_order_value": "float32"
+    })
+
+    X = df[FEATURE_COLS].astype(np.float32)
+    scaled_features = scaler.transform(X).astype(np.float32, copy=False)
+    df["cluster"] = behavior_model.predict(scaled_features)
+    df["predicted_value"] = value_model.predict(scaled_features)
+    df["stability_prob"] = stability_model.predict_proba(scaled_features)[:, 1]
+
+    return df, scaled_features
+
 # This block builds sidebar UI
 # Handles CSV upload
 # Explicit build button prevents auto rerun
@@ -143,39 +197,19 @@ build_button = st.sidebar.button("🚀 Build Intelligence")
 
 # This block handles data preprocessing
 # Runs only after button click
-# Normalizes column names
-# Scales numerical features
-# Applies clustering model
+# Delegates heavy work to the cached builder
 # Stores results in session state
+# Widget reruns hit the cache
+# No recomputation per interaction
 if build_button and uploaded_file is not None:
 
-    df = pd.read_csv(uploaded_file)
-
-    df.columns = (
-        df.columns.astype(str)
-        .str.strip()
-        .str.lower()
-        .str.replace(" ", "_")
-    )
-
-    df = df.rename(columns={"customerid": "customer_id"})
-
-    feature_cols = [
-        "total_orders",
-        "total_quantity",
-        "total_spend",
-        "avg_order_value",
-        "recency_days",
-        "unique_products"
-    ]
-
-    scaler = StandardScaler()
-    scaled_features = scaler.fit_transform(df[feature_cols])
-    df["cluster"] = behavior_model.predict(scaled_features)
+    df, scaled_features = build_features(uploaded_file.getvalue())
 
     st.session_state.df = df
-    st.session_state.scaler = scaler
-    st.session_state.feature_cols = feature_cols
+    st.session_state.scaled_features = scaled_features
+    st.session_state.cust_index = {
+        cid: i for i, cid in enumerate(df["customer_id"].to_numpy())
+    }
     st.session_state.ready = True
 
 # This block renders the main dashboard
@@ -187,32 +221,29 @@ if build_button and uploaded_file is not None:
 if st.session_state.get("ready", False):
 
     df = st.session_state.df
-    scaler = st.session_state.scaler
-    feature_cols = st.session_state.feature_cols
+    cust_index = st.session_state.cust_index
 
     st.subheader("📊 Executive Overview")
 
+    spend_arr = df["total_spend"].to_numpy()
+    orders_arr = df["total_orders"].to_numpy()
+    cluster_arr = df["cluster"].to_numpy()
+
     c1, c2, c3, c4 = st.columns(4)
     c1.metric("Customers", len(df))
-    c2.metric("Avg Spend", round(df["total_spend"].mean(), 2))
-    c3.metric("Avg Orders", round(df["total_orders"].mean(), 2))
-    c4.metric("Clusters", df["cluster"].nunique())
+    c2.metric("Avg Spend", round(float(spend_arr.mean()), 2))
+    c3.metric("Avg Orders", round(float(orders_arr.mean()), 2))
+    c4.metric("Clusters", int(np.unique(cluster_arr).size))
 
     st.subheader("📈 Overall Customer Distribution")
 
-    cluster_counts = df["cluster"].value_counts().sort_index()
-    labels = [CLUSTER_LABELS[c] for c in cluster_counts.index]
-    values = cluster_counts.values
-    total = values.sum()
+    counts = np.bincount(cluster_arr, minlength=len(CLUSTER_LABELS))
+    chart_df = pd.DataFrame({
+        "segment": [CLUSTER_LABELS[i] for i in range(len(counts)) if counts[i] > 0],
+        "customers": counts[counts > 0]
+    })
 
-    def autopct_func(pct):
-        count = int(round(pct * total / 100.0))
-        return f"{count} ({pct:.1f}%)"
-
-    fig, ax = plt.subplots(figsize=(8, 8))
-    ax.pie(values, labels=labels, autopct=autopct_func, startangle=90)
-    ax.axis("equal")
-    st.pyplot(fig)
+    st.bar_chart(chart_df, x="segment", y="customers")
 
     st.subheader("🔍 Individual Customer Intelligence")
 
@@ -221,16 +252,15 @@ if st.session_state.get("ready", False):
         df["customer_id"].unique()
     )
 
-    row = df[df["customer_id"] == selected_customer]
-    X_row = row[feature_cols]
-    X_scaled = scaler.transform(X_row)
+    row_idx = cust_index[selected_customer]
 
-    predicted_value = value_model.predict(X_scaled)[0]
-    risk_prob = stability_model.predict_proba(X_scaled)[0][1]
+    cluster_id = int(df["cluster"].iat[row_idx])
+    predicted_value = float(df["predicted_value"].iat[row_idx])
+    risk_prob = float(df["stability_prob"].iat[row_idx])
     confidence = round(1 - risk_prob, 2)
 
     m1, m2, m3, m4 = st.columns(4)
-    m1.metric("Cluster", CLUSTER_LABELS[int(row["cluster"].values[0])])
+    m1.metric("Cluster", CLUSTER_LABELS[cluster_id])
     m2.metric("Predicted Value", f"{predicted_value:,.2f}")
     m3.metric("Risk %", f"{risk_prob*100:.1f}")
     m4.metric("Confidence", confidence)
@@ -240,7 +270,7 @@ if st.session_state.get("ready", False):
     st.subheader("🎯 Recommended Action Strategy")
     st.success(
         f"""
-        {CLUSTER_ACTIONS[int(row['cluster'].values[0])]}
+        {CLUSTER_ACTIONS[cluster_id]}
         Risk Level: {'LOW' if risk_prob < 0.3 else 'MEDIUM' if risk_prob < 0.6 else 'HIGH'}
         Confidence Score: {confidence}
         """
@@ -248,11 +278,17 @@ if st.session_state.get("ready", False):
 
     st.subheader("⬇️ Download Intelligence Report")
 
-    df["cluster_label"] = df["cluster"].map(CLUSTER_LABELS)
+    label_cats = [CLUSTER_LABELS[i] for i in range(len(CLUSTER_LABELS))]
+    df["cluster_label"] = pd.Categorical.from_codes(
+        df["cluster"].to_numpy(), categories=label_cats
+    )
+
+    buf = pa.BufferOutputStream()
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), buf)
 
     st.download_button(
         "Download CSV Report",
-        df.to_csv(index=False),
+        buf.getvalue().to_pybytes(),
         file_name="customer_genome_intelligence_report.csv",
         mime="text/csv"
     )